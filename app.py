@@ -1,105 +1,220 @@
+import functools
+import io
+import operator
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pac
+import pyarrow.dataset as ds
 from datetime import datetime
 
 st.set_page_config(page_title="FDA Submission Dashboard", layout="wide")
 
+DATA_PATH = "data/fda_submissions_merged.parquet"
+TABLE_ROWS = 1000  # rows rendered in the submissions table
+BAR_COLORS = px.colors.qualitative.Plotly  # one color per bar, as px's color= gave
+CACHE_ENTRIES = 16  # distinct filter keys kept per cache
+
+# Low-cardinality string columns, stored as categoricals by merge_fda_data.py
+CATEGORY_COLUMNS = ("Status", "Submission_Type", "Sponsor", "DrugName")
+
+def to_frame(table):
+    df = table.to_pandas()
+    for c in CATEGORY_COLUMNS:
+        if c in df.columns:
+            # The Parquet dictionaries hold every label; drop the ones the scan filtered out
+            df[c] = df[c].cat.remove_unused_categories()
+    return df
+
 # Load data
-@st.cache_data
+@st.cache_resource
 def load_data():
-    df = pd.read_excel("data/fda_submissions_merged.xlsx", parse_dates=["Submission_Date"])
-    df = df.dropna(subset=["Submission_Date"])  # drop rows for time-series
-    df["Status"] = df["Status"].map({
-        "AP": "Approved",
-        "TA": "Tentative Approval"
-    }).fillna(df["Status"])
-
-    df["Submission_Type"] = df["Submission_Type"].map({
-        "ORIG": "Original",
-        "SUPPL": "Supplemental",
-        "AP": "Abbreviated NDA",
-        "TP": "Therapeutic"
-    }).fillna(df["Submission_Type"])
-
-    df["Sponsor"] = df["Sponsor"].fillna("Unknown")
-    df["DrugName"] = df["DrugName"].fillna("Unknown")
-    df["Submission_Year"] = df["Submission_Date"].dt.year
-    return df
+    return ds.dataset(DATA_PATH, format="parquet")
+
+@st.cache_data
+def load_domain():
+    # Only the filter columns, used to populate the sidebar widgets
+    return to_frame(load_data().to_table(columns=["Submission_Year", "Status", "Sponsor", "DrugName"]))
 
-df = load_data()
+@st.cache_data
+def get_widget_options():
+    # Dataset-constant sidebar options, so reruns don't touch the domain columns
+    df = load_domain()
+    return {
+        "sponsors": df["Sponsor"].cat.categories.tolist(),
+        "drugs": df["DrugName"].cat.categories.tolist(),
+        "statuses": df["Status"].cat.categories.tolist(),
+        "year_min": int(df["Submission_Year"].min()),
+        "year_max": int(df["Submission_Year"].max()),
+    }
+
+def isin(column, values):
+    # Typed value set so an empty multiselect still binds against the string column
+    return ds.field(column).isin(pa.array(values, type=pa.string()))
+
+def narrowing_filters(years, statuses, sponsors, drugs):
+    # Selections that cover a column's whole domain (the defaults) select every row; skip them
+    options = get_widget_options()
+    filters = {}
+    if tuple(years) != (options["year_min"], options["year_max"]):
+        filters["Submission_Year"] = years
+    for column, selected, domain in (("Status", statuses, options["statuses"]),
+                                     ("Sponsor", sponsors, options["sponsors"]),
+                                     ("DrugName", drugs, options["drugs"])):
+        if set(selected) != set(domain):
+            filters[column] = selected
+    return filters
+
+# The frame is shared, not copied, between reruns and the aggregations below; treat it as read-only
+@st.cache_resource(max_entries=CACHE_ENTRIES)
+def get_filtered(years, statuses, sponsors, drugs, search):
+    predicates = []
+    for column, selected in narrowing_filters(years, statuses, sponsors, drugs).items():
+        if column == "Submission_Year":
+            predicates += [ds.field(column) >= selected[0], ds.field(column) <= selected[1]]
+        else:
+            predicates.append(isin(column, selected))
+    if search:
+        # Arrow's substring kernel runs on the stored strings, no regex; the
+        # dictionary-encoded DrugName is decoded to plain strings for it
+        predicates.append(
+            pc.match_substring(ds.field("Application_No"), search, ignore_case=True) |
+            pc.match_substring(ds.field("DrugName").cast(pa.string()), search, ignore_case=True)
+        )
+    predicate = functools.reduce(operator.and_, predicates) if predicates else None
+    return to_frame(load_data().to_table(filter=predicate))
+
+# Aggregations are cached on the filter key tuple rather than the DataFrame, so the cache lookup stays cheap
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def get_kpis(key):
+    filtered = get_filtered(*key)
+    return {
+        "total": len(filtered),
+        "sponsors": filtered["Sponsor"].nunique(),
+        "approved": int((filtered["Status"] == "Approved").sum()),
+        "drugs": filtered["DrugName"].nunique(),
+    }
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def get_top_sponsors(key, n=10):
+    # Count the categorical codes directly; a stable sort over the (few thousand) categories
+    # keeps ties in category order, so the cut at n matches value_counts().nlargest(n)
+    sponsor = get_filtered(*key)["Sponsor"]
+    codes = sponsor.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(sponsor.cat.categories))
+    k = min(n, np.count_nonzero(counts))
+    top_idx = np.argsort(-counts, kind="stable")[:k]
+    return pd.DataFrame({"Sponsor": sponsor.cat.categories[top_idx], "Count": counts[top_idx]})
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def get_monthly(key):
+    filtered = get_filtered(*key)
+    if filtered.empty:
+        return pd.DataFrame({"Submission_Date": pd.Series(dtype="datetime64[us]"), "Submissions": pd.Series(dtype="int64")})
+    counts = filtered.groupby("Submission_YM", sort=True).size()
+    # Fill the months with no submissions, as resample did
+    codes = pd.RangeIndex(counts.index[0], counts.index[-1] + 1)
+    counts = counts.reindex(codes, fill_value=0)
+    month_end = pd.to_datetime({"year": codes // 12, "month": codes % 12 + 1, "day": 1}) + pd.offsets.MonthEnd(0)
+    return pd.DataFrame({"Submission_Date": month_end, "Submissions": counts.to_numpy()})
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def get_status_counts(key):
+    status_counts = get_filtered(*key)["Status"].value_counts().reset_index()
+    status_counts.columns = ["Status", "Count"]
+    return status_counts
+
+@st.cache_data(max_entries=CACHE_ENTRIES)
+def get_type_counts(key):
+    type_counts = get_filtered(*key)["Submission_Type"].value_counts().reset_index()
+    type_counts.columns = ["Submission Type", "Count"]
+    return type_counts
+
+def get_csv(key):
+    # Written with pyarrow's C++ CSV writer into a buffer that is handed to the download button as-is.
+    # Not cached: keeping a full CSV per filter key would cost more memory than rewriting it
+    table = pa.Table.from_pandas(get_filtered(*key).drop(columns=["Submission_YM"]), preserve_index=False)
+    i = table.schema.get_field_index("Submission_Date")
+    table = table.set_column(i, "Submission_Date", table["Submission_Date"].cast(pa.date32()))
+    out = io.BytesIO()
+    pac.write_csv(table, out)
+    out.seek(0)
+    return out
+
+options = get_widget_options()
 
 # Sidebar filters
 st.sidebar.title("🔍 Filter Submissions")
 
 search = st.sidebar.text_input("Search Application No or Drug Name")
-years = st.sidebar.slider("Submission Year", int(df["Submission_Year"].min()), int(df["Submission_Year"].max()),
-                          (int(df["Submission_Year"].min()), int(df["Submission_Year"].max())))
+years = st.sidebar.slider("Submission Year", options["year_min"], options["year_max"],
+                          (options["year_min"], options["year_max"]))
 
-selected_status = st.sidebar.multiselect("Submission Status", df["Status"].unique(), default=df["Status"].unique())
-selected_sponsors = st.sidebar.multiselect("Sponsor", df["Sponsor"].unique()[:30], default=df["Sponsor"].unique()[:10])
-selected_drugs = st.sidebar.multiselect("Drug Name", df["DrugName"].unique()[:50], default=df["DrugName"].unique()[:5])
+selected_status = st.sidebar.multiselect("Submission Status", options["statuses"], default=options["statuses"])
+selected_sponsors = st.sidebar.multiselect("Sponsor", options["sponsors"][:30], default=options["sponsors"][:10])
+selected_drugs = st.sidebar.multiselect("Drug Name", options["drugs"][:50], default=options["drugs"][:5])
 
 # Apply filters
-filtered = df[
-    df["Submission_Year"].between(*years) &
-    df["Status"].isin(selected_status) &
-    df["Sponsor"].isin(selected_sponsors) &
-    df["DrugName"].isin(selected_drugs)
-]
-
-if search:
-    filtered = filtered[
-        filtered["Application_No"].astype(str).str.contains(search, case=False) |
-        filtered["DrugName"].str.contains(search, case=False)
-    ]
+key = (tuple(years), tuple(selected_status), tuple(selected_sponsors), tuple(selected_drugs), search)
+filtered = get_filtered(*key)
 
 # Header
 st.title("💊 FDA Regulatory Submission Dashboard (DEMO)")
 
 # KPIs
 col1, col2, col3, col4 = st.columns(4)
-col1.metric("Total Submissions", f"{len(filtered):,}")
-col2.metric("Unique Sponsors", filtered["Sponsor"].nunique())
-col3.metric("Approved", (filtered["Status"] == "Approved").sum())
-col4.metric("Unique Drugs", filtered["DrugName"].nunique())
+kpis = get_kpis(key)
+col1.metric("Total Submissions", f"{kpis['total']:,}")
+col2.metric("Unique Sponsors", kpis["sponsors"])
+col3.metric("Approved", kpis["approved"])
+col4.metric("Unique Drugs", kpis["drugs"])
 
 # Top Sponsors Bar Chart
 st.subheader("🏢 Top Sponsors by Submission Count")
-top_sponsors = filtered["Sponsor"].value_counts().nlargest(10).reset_index()
-top_sponsors.columns = ["Sponsor", "Count"]
-fig1 = px.bar(top_sponsors, x="Sponsor", y="Count", color="Sponsor", template="plotly_dark", text="Count")
-fig1.update_layout(showlegend=False, xaxis_tickangle=45, height=400)
+top_sponsors = get_top_sponsors(key)
+fig1 = go.Figure(go.Bar(x=top_sponsors["Sponsor"], y=top_sponsors["Count"], text=top_sponsors["Count"],
+                        marker_color=BAR_COLORS[:len(top_sponsors)]))
+fig1.update_layout(template="plotly_dark", xaxis_title="Sponsor", yaxis_title="Count",
+                   showlegend=False, xaxis_tickangle=45, height=400)
 st.plotly_chart(fig1, use_container_width=True)
 
 # Time Series Line Chart
 st.subheader("📈 Monthly Submission Trend")
-monthly = filtered.set_index("Submission_Date").resample("ME").size().reset_index(name="Submissions")
-fig2 = px.line(monthly, x="Submission_Date", y="Submissions", markers=True,
-               title="Monthly Submission Trend", template="plotly_dark")
+monthly = get_monthly(key)
+# WebGL rendering; per-point markers only while the series is short enough to read them
+fig2 = px.line(monthly, x="Submission_Date", y="Submissions", markers=len(monthly) <= 200,
+               render_mode="webgl", title="Monthly Submission Trend", template="plotly_dark")
 fig2.update_layout(height=400)
 st.plotly_chart(fig2, use_container_width=True)
 
 # Pie Chart for Status
 st.subheader("📂 Submission Status Distribution")
-status_counts = filtered["Status"].value_counts().reset_index()
-status_counts.columns = ["Status", "Count"]
-fig3 = px.pie(status_counts, names="Status", values="Count", template="plotly_dark", hole=0.3)
-fig3.update_traces(textinfo="percent+label")
+status_counts = get_status_counts(key)
+fig3 = go.Figure(go.Pie(labels=status_counts["Status"], values=status_counts["Count"], hole=0.3,
+                        textinfo="percent+label"))
+fig3.update_layout(template="plotly_dark")
 st.plotly_chart(fig3, use_container_width=True)
 
 # Submission Type Breakdown
 st.subheader("📋 Submission Type Breakdown")
-type_counts = filtered["Submission_Type"].value_counts().reset_index()
-type_counts.columns = ["Submission Type", "Count"]
-fig4 = px.bar(type_counts, x="Submission Type", y="Count", color="Submission Type", text="Count",
-              template="plotly_dark")
-fig4.update_layout(showlegend=False, height=400)
+type_counts = get_type_counts(key)
+fig4 = go.Figure(go.Bar(x=type_counts["Submission Type"], y=type_counts["Count"], text=type_counts["Count"],
+                        marker_color=BAR_COLORS[:len(type_counts)]))
+fig4.update_layout(template="plotly_dark", xaxis_title="Submission Type", yaxis_title="Count",
+                   showlegend=False, height=400)
 st.plotly_chart(fig4, use_container_width=True)
 
 # Table with Download Option
 st.subheader("🧾 Filtered Submissions Table")
-st.dataframe(filtered, use_container_width=True, height=400)
+# Only the first rows go to the browser; the download has the full selection
+table = filtered.head(TABLE_ROWS).drop(columns=["Submission_YM"])  # internal groupby key
+st.dataframe(table, use_container_width=True, height=400)
+if len(filtered) > TABLE_ROWS:
+    st.caption(f"Showing first {TABLE_ROWS:,} of {len(filtered):,} rows — download CSV for full set")
 
-csv = filtered.to_csv(index=False)
+csv = get_csv(key)
 st.download_button("📥 Download Filtered Data", data=csv, file_name="filtered_fda_submissions.csv", mime="text/csv")
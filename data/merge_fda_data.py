@@ -1,32 +1,78 @@
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-# Verify openpyxl is installed
+# Pass --excel to also write an .xlsx copy for human inspection
+write_excel = "--excel" in sys.argv
+
+# Verify pyarrow is installed (Parquet engine)
 try:
-    import openpyxl
+    import pyarrow
+    import pyarrow.csv as pac
 except ImportError:
-    print("Error: 'openpyxl' is not installed. Install it using 'pip install openpyxl'.")
+    print("Error: 'pyarrow' is not installed. Install it using 'pip install pyarrow'.")
     exit(1)
 
+# Verify openpyxl is installed (only needed for the optional Excel copy)
+if write_excel:
+    try:
+        import openpyxl
+    except ImportError:
+        print("Error: 'openpyxl' is not installed. Install it using 'pip install openpyxl'.")
+        exit(1)
+
+def join_by_key(keys, values, groups):
+    """", ".join the non-null values of each key, in row order, for every key in groups."""
+    present = values.notna().to_numpy()
+    keys = keys.to_numpy()[present]
+    values = values.to_numpy(dtype=object)[present]
+
+    # Sort rows by key (stable keeps row order within a key), then concatenate each run in one reduceat
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    found, starts = np.unique(keys, return_index=True)
+    if len(values):
+        joined = pd.Series(np.add.reduceat(values + ", ", starts), index=found).str[:-2]
+    else:
+        joined = pd.Series(dtype=object)
+    # Keys whose values are all missing join to an empty string
+    return joined.reindex(groups, fill_value="")
+
+def read_txt(path, columns, skip_bad_lines=False):
+    """Read the kept columns of a tab-separated FDA file with pyarrow's multi-threaded CSV reader."""
+    table = pac.read_csv(
+        path,
+        read_options=pac.ReadOptions(encoding="latin1"),
+        parse_options=pac.ParseOptions(delimiter="\t", invalid_row_handler=(lambda row: "skip") if skip_bad_lines else None),
+        # Only the kept columns are decoded; empty strings become nulls, as with pd.read_csv
+        convert_options=pac.ConvertOptions(include_columns=columns, strings_can_be_null=True),
+    )
+    return table.to_pandas()
+
 # Path to the current directory
 data_dir = os.path.dirname(os.path.abspath(__file__))
 print("Data directory:", data_dir)
 
 try:
-    # Load main files
-    submissions = pd.read_csv(os.path.join(data_dir, "Submissions.txt"), sep="\t", encoding="latin1")
-    applications = pd.read_csv(os.path.join(data_dir, "Applications.txt"), sep="\t", encoding="latin1")
-    products = pd.read_csv(os.path.join(data_dir, "Products.txt"), sep="\t", encoding="latin1", on_bad_lines="skip")
+    # Load main files, keeping only the necessary columns. The reads are independent, so run
+    # them concurrently; pyarrow releases the GIL while parsing.
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [
+            pool.submit(read_txt, os.path.join(data_dir, "Submissions.txt"),
+                        ["ApplNo", "SubmissionType", "SubmissionNo", "SubmissionStatus", "SubmissionStatusDate", "ReviewPriority"]),
+            pool.submit(read_txt, os.path.join(data_dir, "Applications.txt"), ["ApplNo", "SponsorName"]),
+            pool.submit(read_txt, os.path.join(data_dir, "Products.txt"), ["ApplNo", "Form", "Strength", "DrugName"],
+                        skip_bad_lines=True),
+        ]
+        sub, apps, prods = (f.result() for f in futures)
 
     # Print columns and row counts for verification
-    print("Submissions columns:", submissions.columns.tolist(), f"({len(submissions)} rows)")
-    print("Applications columns:", applications.columns.tolist(), f"({len(applications)} rows)")
-    print("Products columns:", products.columns.tolist(), f"({len(products)} rows)")
-
-    # Keep necessary columns
-    sub = submissions[["ApplNo", "SubmissionType", "SubmissionNo", "SubmissionStatus", "SubmissionStatusDate", "ReviewPriority"]].copy()
-    apps = applications[["ApplNo", "SponsorName"]].copy()
-    prods = products[["ApplNo", "Form", "Strength", "DrugName"]].copy()
+    print("Submissions columns:", sub.columns.tolist(), f"({len(sub)} rows)")
+    print("Applications columns:", apps.columns.tolist(), f"({len(apps)} rows)")
+    print("Products columns:", prods.columns.tolist(), f"({len(prods)} rows)")
 
     # Rename for clarity
     sub.rename(columns={
@@ -52,11 +98,9 @@ try:
     prods["Application_No"] = prods["Application_No"].astype(str)
 
     # Aggregate products by Application_No
-    prods = prods.groupby("Application_No").agg({
-        "Form": lambda x: ", ".join(x.dropna()),
-        "Strength": lambda x: ", ".join(x.dropna()),
-        "DrugName": lambda x: ", ".join(x.dropna())
-    }).reset_index()
+    groups = np.unique(prods["Application_No"].to_numpy())
+    joined = {c: join_by_key(prods["Application_No"], prods[c], groups).to_numpy() for c in ("Form", "Strength", "DrugName")}
+    prods = pd.DataFrame({"Application_No": groups, **joined})
 
     # Check for duplicates
     print("Unique Application_No in Submissions:", sub["Application_No"].nunique())
@@ -65,11 +109,18 @@ try:
     print("Duplicate Application_No in Applications:", apps["Application_No"].duplicated().sum())
     print("Duplicate Application_No in Products:", prods["Application_No"].duplicated().sum())
 
+    # Shared categories so the merges join on integer codes
+    keys = union_categoricals([pd.Categorical(d["Application_No"]) for d in (sub, apps, prods)]).categories
+    for d in (sub, apps, prods):
+        d["Application_No"] = pd.Categorical(d["Application_No"], categories=keys)
+
     # Merge step-by-step
-    df = sub.merge(apps, on="Application_No", how="left")
+    df = sub.merge(apps, on="Application_No", how="left", sort=False)
     print("Rows after merging with Applications:", len(df))
-    df = df.merge(prods, on="Application_No", how="left")
+    df = df.merge(prods, on="Application_No", how="left", sort=False)
     print("Merged rows:", len(df))
+    # Arrow-backed strings (contiguous UTF-8 + offsets) rather than one Python object per cell
+    df["Application_No"] = df["Application_No"].astype("string[pyarrow]")
 
     # Clean submission type and status codes
     submission_type_map = {
@@ -79,19 +130,52 @@ try:
     df["Submission_Type"] = df["Submission_Type"].replace(submission_type_map)
     print("Unique Submission Types:", df["Submission_Type"].unique().tolist())
 
+    status_map = {"AP": "Approved", "TA": "Tentative Approval"}
+    df["Status"] = df["Status"].replace(status_map)
+    print("Unique Statuses:", df["Status"].unique().tolist())
+
     # Clean Form column, handling missing values
     if "Form" in df.columns:
         df["Form"] = df["Form"].fillna("").str.replace(";", " / ", regex=False)
 
-    # Save to Excel
-    output_path = os.path.join(data_dir, "fda_submissions_merged.xlsx")
+    # Parse submission dates so the datetime dtype persists in the Parquet file
+    df["Submission_Date"] = pd.to_datetime(df["Submission_Date"], errors="coerce")
+    df = df.dropna(subset=["Submission_Date"])  # drop rows for time-series
+
+    # Fill the dashboard filter columns so app.py can filter on them directly in the Parquet scan
+    df["Status"] = df["Status"].fillna("Unknown")
+    df["Sponsor"] = df["Sponsor"].fillna("Unknown")
+    df["DrugName"] = df["DrugName"].fillna("Unknown")
+    df["Submission_Year"] = df["Submission_Date"].dt.year.astype("int16")  # years fit in int16
+    # Integer year-month key (year * 12 + month - 1) for the monthly trend groupby
+    df["Submission_YM"] = (df["Submission_Date"].dt.year * 12 + df["Submission_Date"].dt.month - 1).astype("int32")
+
+    # Store the label columns as categoricals (dictionary-encoded in Parquet), categories in order of first appearance
+    for c in ("Status", "Submission_Type", "Sponsor", "DrugName"):
+        df[c] = pd.Categorical(df[c], categories=df[c].dropna().unique())
+
+    # Save to Parquet (served by app.py)
+    output_path = os.path.join(data_dir, "fda_submissions_merged.parquet")
     print("Output path:", output_path)
-    df.to_excel(output_path, index=False)
+    df.to_parquet(output_path, engine="pyarrow", compression="snappy", index=False)
     print(f"✅ Cleaned and saved to {output_path}")
 
+    # Optionally save to Excel for human inspection
+    if write_excel:
+        excel_path = os.path.join(data_dir, "fda_submissions_merged.xlsx")
+        # Stream rows through a write-only workbook instead of building the full sheet DOM
+        sheet = df.drop(columns=["Submission_YM"])  # internal groupby key, not for inspection
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")
+        ws.append(sheet.columns.tolist())
+        for row in sheet.astype(object).where(sheet.notna(), None).itertuples(index=False, name=None):
+            ws.append(row)
+        wb.save(excel_path)
+        print(f"✅ Excel copy saved to {excel_path}")
+
 except FileNotFoundError as e:
     print(f"Error: File not found - {e}")
-except pd.errors.ParserError as e:
+except pyarrow.ArrowInvalid as e:
     print(f"Error: Parsing issue - {e}")
 except KeyError as e:
     print(f"Error: Column not found - {e}")